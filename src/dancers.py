@@ -457,7 +457,7 @@ class StepsFile:
             dict = {}
             for i in range(len(names)):
                 dict[names[i]] = values[i]
-                result.append(dict)
+            result.append(dict)
         return result
 
 
@@ -0,0 +1,841 @@
+#!/usr/bin/env python
+"""
+ Tests for the pivot dance language compiler, src/pivot.
+
+   $ python src/pivot_tests.py          # run the tests
+   $ python src/pivot_tests.py --show   # print parse trees of the test code
+
+ Each codeTests case is compiled in its own worker process and
+ timed; the scalingTests check that the parsing work grows about linearly
+ with the length and nesting depth of the dance.
+
+ license: GPL
+ project site: http://code.google.com/pivotstep/
+ contact: Jim Mahoney <james.h.mahoney@gmail.com>
+
+"""
+
+import time, sys, os, imp, math, json, multiprocessing, StringIO
+import timeline
+
+# src/pivot is a script without a .py extension, so load it by path.
+srcFolder = os.path.dirname(os.path.abspath(__file__))
+pivot = imp.load_source('pivot', os.path.join(srcFolder, 'pivot'))
+elFlete = os.path.join(srcFolder, '..', 'dances', 'tango', 'el_flete',
+                       'el_flete.pivot')
+grammarOnImport = pivot.pivotDance
+
+# == setup ==
+
+showTestsCompilation = False
+
+# == testing ==
+
+timeBudget = 2.0       # default max seconds to parse and compile one test case
+scalingSizes = (1, 2, 4, 8)   # multiples of N compiled by the scaling tests
+slopeLimit = 1.1       # max slope of log(parse steps) vs log(size); linear is 1
+hangTimeout = 60.0     # seconds to wait for a worker before calling it stuck
+
+def runCodeTest(code):
+    """ Compile code and return (parseTree, parseSeconds, compileSeconds).
+        Called in a worker process, one per test, so the global parser state
+        (e.g. indentStack) can't leak between tests.
+        """
+    dance = pivot.Dance(code)
+    return ('\n' + dance.asTree(), dance.parseSeconds, dance.compileSeconds)
+
+def scalingCode(head, body, size, nested):
+    """ Return head + size copies of body, each one indented
+        a level deeper than the last if nested. """
+    if nested:
+        return head + ''.join('  '*i + body for i in range(size)) + \
+            '  '*size + "c\n"
+    return head + body*size + "\n"
+
+def runScalingTest(head, body, n, nested):
+    """ Compile scalingCode() for each of the sizes n*scalingSizes,
+        and return lists of (seconds, parseSteps) for each,
+        where parseSteps counts pyparsing element match attempts.
+        """
+    import pyparsing
+    parse = pyparsing.ParserElement._parse
+    steps = []
+    def countingParse(self, *args, **kwargs):
+        steps[-1] += 1
+        return parse(self, *args, **kwargs)
+    seconds = []
+    for size in scalingSizes:
+        code = scalingCode(head, body, n*size, nested)
+        timer = pivot.Timer()
+        pivot.Dance(code)
+        seconds.append(timer.seconds())
+        steps.append(0)
+        recursionLimit = sys.getrecursionlimit()
+        sys.setrecursionlimit(4*recursionLimit)   # countingParse adds frames
+        pyparsing.ParserElement._parse = countingParse
+        try:
+            pivot.Dance(code)
+        finally:
+            pyparsing.ParserElement._parse = parse
+            sys.setrecursionlimit(recursionLimit)
+    return (seconds, steps)
+
+def logSlope(sizes, costs):
+    """ Return least squares slope of log(costs) vs log(sizes),
+        i.e. p for costs growing like size**p. """
+    xs = [math.log(x) for x in sizes]
+    ys = [math.log(max(y, 1.0e-6)) for y in costs]
+    (xMean, yMean) = (sum(xs)/len(xs), sum(ys)/len(ys))
+    return sum((x - xMean)*(y - yMean) for (x, y) in zip(xs, ys)) / \
+        sum((x - xMean)**2 for x in xs)
+
+def scanSteps(steps, keep):
+    """ Return the steps for which keep(who, clock, beats) is True,
+        sorted by clock, who, and original order, by checking each one. """
+    found = []
+    for (i, step) in enumerate(steps):
+        (who, clock, beats) = (step['who'], float(step['clock']), float(step['beats']))
+        if keep(who, clock, beats):
+            found.append((clock, who, i, step))
+    found.sort()
+    return [f[3] for f in found]
+
+def isWho(who, dancer):
+    """ True if who is dancer or a parallel who like '_man_woman_' with it. """
+    return dancer == None or who == dancer or ('_' + dancer + '_') in who
+
+def isDuring(clock, beats, start, end):
+    """ True if a step is in progress during [start, end), or at start
+        if end == start; a zero beat step is only in progress at its clock. """
+    if beats == 0:
+        return clock == start or start <= clock < end
+    if end == start:
+        return clock <= start < clock + beats
+    return clock < end and clock + beats > start
+
+class Tests:
+    """ Print test results to the console.
+        Usage: Tests(codeTests, scalingTests).run() # or .show()
+        """
+    def __init__(self, codeTests, scalingTests=None):
+        self.codeTests = codeTests
+        self.scalingTests = scalingTests if scalingTests != None else []
+
+    def run(self):
+        """ Run tests in parallel worker processes and print results. """
+        self.printBanner()
+        self.runTests(self.codeTests)
+        self.printTestResults()
+
+    def show(self):
+        """ Print output from parsing test code. """
+        print " - "*20
+        for test in self.codeTests:
+            code = test[0]
+            print code
+            print pivot.Dance(code).asTree()
+            print " - "*20
+
+    def printBanner(self):
+        scriptName = 'pivot'
+        textLength = 41 - len(scriptName)
+        print "="*textLength
+        isoTime = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
+        # or just time.ctime()
+        print "=== %s on %s === " % (scriptName, isoTime)
+        print "="*textLength
+
+    def ok(self, assertion, message):
+        """ Run a single test, printing 'ok' or 'not ok' and the message. """
+        status = ' not ok'
+        self.nTestsRun += 1
+        if assertion:
+            status = ' ok'
+            self.nTestsOk += 1
+        print " %-8s  %s " % (status, message)
+
+    def printTestResults(self):
+        print " Finished %i tests." % self.nTestsRun
+        if self.nTestsRun == self.nTestsOk:
+            print " All tests passed."
+        else:
+            nFailed = self.nTestsRun - self.nTestsOk
+            print " ** Oops: failed %i test%s." % (nFailed, 's' if nFailed>1 else '')
+
+    def collect(self, result):
+        """ Return (value, error) from a worker's result.
+            A parse that never finishes (e.g. catastrophic backtracking)
+            gives an error rather than hanging the tests.
+            """
+        try:
+            return (result.get(hangTimeout), '')
+        except multiprocessing.TimeoutError:
+            return (None, 'stuck for %g sec' % hangTimeout)
+        except Exception as e:
+            return (None, str(e))
+
+    def runTests(self, codeTests):
+        self.nTestsRun = 0
+        self.nTestsOk = 0
+        print " Starting tests."
+        self.ok(1==1, "test infrastructure")
+        # Build the grammar here, so that a mistake in it fails right away
+        # with its traceback; the forked workers inherit it, built, and
+        # so don't include building it in their timings.
+        pivot.getGrammar()
+        # A fresh process per test.
+        pool = multiprocessing.Pool(maxtasksperchild=1)
+        codeResults = [pool.apply_async(runCodeTest, (test[0],))
+                       for test in codeTests]
+        pool.close()
+        # codeTests are (code, expectedParse) or (code, expectedParse, budget)
+        trees = []
+        for (test, result) in zip(codeTests, codeResults):
+            (code, expectedParse) = test[:2]
+            budget = test[2] if len(test) > 2 else timeBudget
+            codelines = code.splitlines()
+            if len(codelines) > 1:
+                message = codelines[1]
+            else:
+                message = "code line [" + codelines[0] + "]"
+            (value, error) = self.collect(result)
+            if error:
+                trees.append(None)
+                self.ok(False, "%s  [%s]" % (message, error))
+                continue
+            (parseTree, parseSeconds, compileSeconds) = value
+            trees.append(parseTree)
+            seconds = parseSeconds + compileSeconds
+            timing = "parse %.3fs, compile %.3fs" % (parseSeconds, compileSeconds)
+            if seconds > budget:
+                timing += ", over %gs budget" % budget
+            self.ok(parseTree == expectedParse and seconds <= budget,
+                    "%s  [%s]" % (message, timing))
+            if showTestsCompilation:
+                print code + "\n" + str(pivot.Dance(code))
+        # line blocks vs blocks
+        self.ok(trees[1] != None and trees[2] == trees[1],
+                'lineblocks and blocks parse same')
+        pool.terminate()
+        # N, 2N, 4N, 8N copies of a snippet, one at a time so that other
+        # tests don't disturb the timing, each in its own pool so that
+        # one that hangs is killed before the next starts.
+        for test in self.scalingTests:
+            (message, head, body, n, nested, perCopy) = test
+            pool = multiprocessing.Pool(processes=1)
+            (value, error) = self.collect(pool.apply_async(runScalingTest,
+                                                           (head, body, n, nested)))
+            pool.terminate()
+            if error:
+                self.ok(False, "%s  [%s]" % (message, error))
+                continue
+            (seconds, steps) = value
+            sizes = [n*size for size in scalingSizes]
+            # Parse steps, unlike seconds, don't depend on what else is running.
+            slope = logSlope(sizes, steps)
+            budget = perCopy * sizes[-1]
+            timing = "%s copies: %.3fs .. %.3fs, steps slope %.2f" % \
+                (' '.join(map(str, sizes)), seconds[0], seconds[-1], slope)
+            if seconds[-1] > budget:
+                timing += ", over %gs budget" % budget
+            self.ok(slope <= slopeLimit and seconds[-1] <= budget,
+                    "%s  [%s]" % (message, timing))
+        pool.terminate()
+        self.runServeTests()
+        self.runTimelineTests()
+
+    def runServeTests(self):
+        self.ok(grammarOnImport == None, "grammar not built on import")
+        code = codeTests[13][0]
+        steps = pivot.Dance(code).asFullFormText() + "\n"
+        request = json.dumps(code)
+        self.ok(pivot.compileRequest(request) == steps, "serve inline code")
+        missing = pivot.compileRequest("no/such/dance")
+        self.ok(missing.startswith("# error:") and missing.endswith("\n\n"),
+                "  serve missing file")
+        answers = StringIO.StringIO()
+        pivot.serve(StringIO.StringIO(request + "\n\n" + request + "\n"), answers)
+        self.ok(answers.getvalue() == steps + steps, "  serve request lines")
+
+    def runTimelineTests(self):
+        dance = pivot.Dance(codeTests[13][0])
+        index = dance.timeline()
+        self.ok(index.dancers() == ['man', 'woman'], "timeline dancers")
+        self.ok([s['what'] for s in index.at(3.0)] == ['raises', 'smiles', 'forward'],
+                "  at()")
+        self.ok([s['what'] for s in index.at(9.5, 'man')] == ['dip'],
+                "  parallel step in each dancer's view")
+        self.ok([s['what'] for s in index.stepsFrom(5.0, 'woman')] == \
+                    ['raises', 'smiles', 'side', 'dip'], "  stepsFrom()")
+        # hand checked edges of steps
+        steps = [{'who':'man', 'what':'stands', 'how':'', 'clock':2.0, 'beats':0.0},
+                 {'who':'man', 'what':'forward', 'how':'', 'clock':2.0, 'beats':1.0},
+                 {'who':'man', 'what':'side', 'how':'', 'clock':3.0, 'beats':1.0},
+                 {'who':'woman', 'what':'back', 'how':'', 'clock':0.0, 'beats':2.0}]
+        index = timeline.Timeline(steps)
+        whats = lambda found: [step['what'] for step in found]
+        self.ok(whats(index.at(2.0)) == ['stands', 'forward'],
+                "  at() the end of one step and start of others")
+        self.ok(whats(index.during(1.0, 2.0)) == ['back'],
+                "  during() ending at a step's clock")
+        self.ok(whats(index.during(2.0, 3.0)) == ['stands', 'forward'],
+                "  during() starting at a zero beat step")
+        self.ok(whats(index.at(3.0, 'man')) == ['side'],
+                "  at() one dancer")
+        try:
+            index.during(3.0, 2.0)
+            rejected = False
+        except Exception:
+            rejected = True
+        self.ok(rejected, "  during() rejects a reversed range")
+        # compare with a scan of every step, using .steps style string values
+        steps = [dict((key, str(value)) for (key, value) in step.items())
+                 for step in pivot.Dance(file=elFlete).steps]
+        index = timeline.Timeline(steps)
+        clocks = [i/4.0 for i in range(-4, 4*20)]
+        dancers = (None, 'man', 'woman')
+        self.ok(all(index.during(t, t + 1.5, d) == scanSteps(steps,
+                        lambda who, clock, beats: isWho(who, d) and \
+                            isDuring(clock, beats, t, t + 1.5))
+                    for t in clocks for d in dancers),
+                "  during() matches scan")
+        self.ok(all(index.at(t, d) == scanSteps(steps,
+                        lambda who, clock, beats: isWho(who, d) and \
+                            isDuring(clock, beats, t, t))
+                    for t in clocks for d in dancers),
+                "  at() matches scan")
+        self.ok(all(list(index.stepsFrom(t, d)) == scanSteps(steps,
+                        lambda who, clock, beats: isWho(who, d) and \
+                            (clock > t or isDuring(clock, beats, t, t)))
+                    for t in clocks for d in ('man', 'woman')),
+                "  stepsFrom() matches scan")
+
+# (message, head, body, N, nested, secondsPerCopy) :
+# compile head + N, 2N, 4N, 8N copies of body, nested or one after another,
+# which should take linear parse steps, and at most secondsPerCopy each.
+scalingTests = [
+    ("scaling: sequence lines", "",
+     "man forward, woman side\n", 30, False, 0.1),
+    ("scaling: simultaneous lines", "",
+     "man forward; woman side;\n", 30, False, 0.1),
+    ("scaling: parallel block lines", "john & mary:\n",
+     " walk, side ! run, back\n", 30, False, 0.1),
+    ("scaling: repeated blocks", "",
+     "a:\n  b: c\n  d\n", 10, False, 0.3),
+    ("scaling: nesting depth", "",
+     "a:\n", 5, True, 0.25),
+    ("scaling: long comma line", "",
+     "step, ", 60, False, 0.04),
+    ("scaling: long expression", "",
+     "word ", 60, False, 0.04),
+    ]
+
+codeTests = [
+    # -------------------------
+    (""" """ , """
+  pivot
+    empty line
+"""),
+    # -------------------------
+    ("""
+# 1: line block
+a: b: c
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        'a'
+      block body
+        block
+          block head
+            'b'
+          block body
+            line
+              expression
+                'c'
+"""),
+    # -------------------------
+    ("""
+# 2: block
+a:
+  b:
+    c
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        'a'
+      block body
+        block
+          block head
+            'b'
+          block body
+            line
+              expression
+                'c'
+"""),
+    # -------------------------
+    ("""
+# 3: expression
+value is 4.2 or so   # I think
+""" , """
+  pivot
+    empty line
+    line
+      expression
+        'value'
+        'is'
+        '4.2'
+        'or'
+        'so'
+"""),
+    # -------------------------
+  ("""
+# 4: comma and semicolon lines
+one, two, three
+four, five,
+alpha;
+he went; she just watched
+four; five;
+""" , """
+  pivot
+    empty line
+    line
+      expressions comma
+        expression
+          'one'
+        expression
+          'two'
+        expression
+          'three'
+    line
+      expressions comma
+        expression
+          'four'
+        expression
+          'five'
+    line simul
+      expression
+        'alpha'
+    line
+      expressions semi
+        expression
+          'he'
+          'went'
+        expression
+          'she'
+          'just'
+          'watched'
+    line simul
+      expressions semi
+        expression
+          'four'
+        expression
+          'five'
+"""),
+    # -------------------------
+  ("""
+# 5: mixed blocks, expressions, sequences
+for 3.2 sec or so:
+  john walks forward; jane waits;
+  mary steps back
+  during 3 beats: paul:
+    side step, forward step,
+    back step
+  john stands on one foot
+for another 5 sec: everyone claps
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        'for'
+        '3.2'
+        'sec'
+        'or'
+        'so'
+      block body
+        line simul
+          expressions semi
+            expression
+              'john'
+              'walks'
+              'forward'
+            expression
+              'jane'
+              'waits'
+        line
+          expression
+            'mary'
+            'steps'
+            'back'
+        block
+          block head
+            'during'
+            '3'
+            'beats'
+          block body
+            block
+              block head
+                'paul'
+              block body
+                line
+                  expressions comma
+                    expression
+                      'side'
+                      'step'
+                    expression
+                      'forward'
+                      'step'
+                line
+                  expression
+                    'back'
+                    'step'
+        line
+          expression
+            'john'
+            'stands'
+            'on'
+            'one'
+            'foot'
+    block
+      block head
+        'for'
+        'another'
+        '5'
+        'sec'
+      block body
+        line
+          expression
+            'everyone'
+            'claps'
+"""),
+    # -------------------------
+  ("""
+# 6: at|in time
+at 3 sec: john walked
+in 4 beats: jane steps right onto left
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        at
+          'at'
+          '3'
+          'sec'
+      block body
+        line
+          expression
+            'john'
+            'walked'
+    block
+      block head
+        in
+          'in'
+          '4'
+          'beats'
+      block body
+        line
+          expression
+            'jane'
+            'steps'
+            'right'
+            'onto'
+            'left'
+"""),
+    # -------------------------
+  ("""
+# 7: about something
+about stuff:
+  color: red
+  style: blue
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        about
+          'about'
+          'stuff'
+      block body
+        block
+          block head
+            'color'
+          block body
+            line
+              expression
+                'red'
+        block
+          block head
+            'style'
+          block body
+            line
+              expression
+                'blue'
+"""),
+    # -------------------------
+  ("""
+# 8: duration
+man forward slow  (3 beats)
+""" , """
+  pivot
+    empty line
+    line
+      expression
+        'man'
+        'forward'
+        'slow'
+      duration
+        '3'
+        'beats'
+"""),
+    # -------------------------
+  ("""
+# 8: fraction
+man forward quick; woman back quick  (1/3 beat)
+""" , """
+  pivot
+    empty line
+    line
+      expressions semi
+        expression
+          'man'
+          'forward'
+          'quick'
+        expression
+          'woman'
+          'back'
+          'quick'
+      duration
+        fraction
+          '1'
+          '/'
+          '3'
+        'beat'
+"""),
+    # -------------------------
+  ("""
+# 9: parallel block
+john         & mary         & alice:
+ walk        !  run         !  hop
+ side, side  !  side, back  !  over, out
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        atoms parallel
+          'john'
+          'mary'
+          'alice'
+      block body
+        parallel line
+          parallel
+            expression
+              'walk'
+            expression
+              'run'
+            expression
+              'hop'
+        parallel line
+          parallel comma
+            expressions comma
+              expression
+                'side'
+              expression
+                'side'
+            expressions comma
+              expression
+                'side'
+              expression
+                'back'
+            expressions comma
+              expression
+                'over'
+              expression
+                'out'
+"""),
+    # -------------------------
+  ("""
+# 10: parallel atoms
+mary & john walk
+""" , """
+  pivot
+    empty line
+    line
+      expression
+        atoms parallel
+          'mary'
+          'john'
+        'walk'
+"""),
+    # -------------------------
+  ("""
+# 11: parallel block variations
+will & sally:
+  embrace;
+  forward, shift ! back, shift (3)
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        atoms parallel
+          'will'
+          'sally'
+      block body
+        line simul
+          expression
+            'embrace'
+        parallel line
+          parallel comma
+            expressions comma
+              expression
+                'forward'
+              expression
+                'shift'
+            expressions comma
+              expression
+                'back'
+              expression
+                'shift'
+          duration
+            '3'
+"""),
+    # -------------------------
+  ("""
+# 12: simultaneous vs sequential timing
+about:
+  dancers: man, woman
+man stands on right; man waves;
+man forward onto left
+woman raises arm; woman smiles;   (6 beats)
+woman forward, woman side         (8 beats)
+man & woman dip                   (10 beats)
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        about
+          'about'
+      block body
+        block
+          block head
+            'dancers'
+          block body
+            line
+              expressions comma
+                expression
+                  'man'
+                expression
+                  'woman'
+    line simul
+      expressions semi
+        expression
+          'man'
+          'stands'
+          'on'
+          'right'
+        expression
+          'man'
+          'waves'
+    line
+      expression
+        'man'
+        'forward'
+        'onto'
+        'left'
+    line simul
+      expressions semi
+        expression
+          'woman'
+          'raises'
+          'arm'
+        expression
+          'woman'
+          'smiles'
+      duration
+        '6'
+        'beats'
+    line
+      expressions comma
+        expression
+          'woman'
+          'forward'
+        expression
+          'woman'
+          'side'
+      duration
+        '8'
+        'beats'
+    line
+      expression
+        atoms parallel
+          'man'
+          'woman'
+        'dip'
+      duration
+        '10'
+        'beats'
+"""),
+    # -------------------------
+  ("""
+# 13: who block
+about:
+  dancers: man
+man:
+  forward, side
+  wave; smile;
+""" , """
+  pivot
+    empty line
+    block
+      block head
+        about
+          'about'
+      block body
+        block
+          block head
+            'dancers'
+          block body
+            line
+              expression
+                'man'
+    block
+      block head
+        'man'
+      block body
+        line
+          expressions comma
+            expression
+              'forward'
+            expression
+              'side'
+        line simul
+          expressions semi
+            expression
+              'wave'
+            expression
+              'smile'
+"""),
+    # -------------------------
+  ("""
+# template
+""" , """
+  pivot
+    empty line
+"""),
+]
+
+
+# == main ==
+
+if __name__ == "__main__":
+    if '--show' in sys.argv[1:]:
+        Tests(codeTests).show()
+    else:
+        Tests(codeTests, scalingTests).run()
@@ -0,0 +1,144 @@
+"""
+ timeline.py
+
+ An index of dance steps by time, to answer questions like
+ "what is every dancer doing at beat 37.5" without replaying the dance.
+
+ The steps are dicts with 'who', 'what', 'how', 'clock', and 'beats' keys,
+ as in pivot's Dance.steps or dancers.py's StepsFile.read().
+ (The clock and beats values may be numbers or strings.)
+ Each step lasts from its clock to clock + beats, in beats.
+
+ Usage:
+   timeline = Timeline(steps)
+   timeline.at(37.5)                  # steps in progress at beat 37.5
+   timeline.during(32, 40, 'woman')   # woman's steps overlapping [32, 40)
+   for step in timeline.stepsFrom(16.0, 'man'): ...
+
+ Parallel steps, whose who is e.g. '_man_woman_', are in the
+ per-dancer views of each of those dancers.
+
+ license: GPL
+ project site: http://code.google.com/pivotstep/
+ contact: Jim Mahoney <james.h.mahoney@gmail.com>
+"""
+
+from bisect import bisect_right
+
+def whoDancers(who):
+    """ Return list of dancers in a who, e.g. '_man_woman_' => ['man', 'woman']. """
+    if len(who) > 2 and who.startswith('_') and who.endswith('_'):
+        return who[1:-1].split('_')
+    return [who]
+
+
+class Span:
+    """ A step with its numeric start and end clock. """
+    def __init__(self, step, order=0):
+        self.step = step
+        self.order = order   # index in the original steps list
+        self.start = float(step['clock'])
+        self.end = self.start + float(step['beats'])
+    def key(self):
+        """ Sort key: clock, then who, then original order. """
+        return (self.start, str(self.step['who']), self.order)
+    def overlaps(self, start, end):
+        """ True if this step is in progress during [start, end),
+            or at start if end == start.
+            A step with no duration is only in progress at its clock. """
+        if self.end == self.start:
+            return start <= self.start < end or self.start == start
+        if end == start:
+            return self.start <= start < self.end
+        return self.start < end and self.end > start
+
+
+class IntervalTree:
+    """ Spans indexed by time, as a centered interval tree. """
+    def __init__(self, spans):
+        # spans overlapping the center are kept here, sorted both ways;
+        # those entirely before or after it are in the left and right trees.
+        points = sorted([s.start for s in spans] + [s.end for s in spans])
+        self.center = points[len(points)//2]
+        here = [s for s in spans if s.start <= self.center <= s.end]
+        left = [s for s in spans if s.end < self.center]
+        right = [s for s in spans if s.start > self.center]
+        self.byStart = sorted(here, key=lambda s: s.start)
+        self.byEnd = sorted(here, key=lambda s: s.end, reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+    def search(self, low, high, found):
+        """ Append to found the spans that touch [low, high], and return it. """
+        if high < self.center:
+            for span in self.byStart:
+                if span.start > high:
+                    break
+                found.append(span)
+            if self.left:
+                self.left.search(low, high, found)
+        elif low > self.center:
+            for span in self.byEnd:
+                if span.end < low:
+                    break
+                found.append(span)
+            if self.right:
+                self.right.search(low, high, found)
+        else:
+            found.extend(self.byStart)
+            if self.left:
+                self.left.search(low, high, found)
+            if self.right:
+                self.right.search(low, high, found)
+        return found
+
+
+class Timeline:
+    """ Steps indexed by time, for all dancers and for each one. """
+
+    def __init__(self, steps):
+        self.steps = steps
+        spans = [Span(step, i) for (i, step) in enumerate(steps)]
+        self.all = IntervalTree(spans) if spans else None
+        self.trees = {}      # {dancer: IntervalTree}
+        self.starts = {}     # {dancer: [start clock, ...]} sorted
+        self.spans = {}      # {dancer: [Span, ...]} in the same order
+        bySpan = {}
+        for span in spans:
+            for dancer in whoDancers(str(span.step['who'])):
+                bySpan.setdefault(dancer, []).append(span)
+        for (dancer, dancerSpans) in bySpan.items():
+            dancerSpans.sort(key=Span.key)
+            self.trees[dancer] = IntervalTree(dancerSpans)
+            self.starts[dancer] = [s.start for s in dancerSpans]
+            self.spans[dancer] = dancerSpans
+
+    def dancers(self):
+        """ Return sorted list of dancer names. """
+        return sorted(self.trees.keys())
+
+    def during(self, start, end, who=None):
+        """ Return list of steps in progress during [start, end),
+            for one dancer or (by default) everyone, in clock order. """
+        if end < start:
+            raise Exception("in during: end %g is before start %g" % (end, start))
+        tree = self.all if who == None else self.trees.get(who)
+        if not tree:
+            return []
+        spans = [s for s in tree.search(start, end, []) if s.overlaps(start, end)]
+        spans.sort(key=Span.key)
+        return [s.step for s in spans]
+
+    def at(self, clock, who=None):
+        """ Return list of steps in progress at the given clock. """
+        return self.during(clock, clock, who)
+
+    def stepsFrom(self, clock, who):
+        """ Yield in clock order one dancer's steps,
+            starting with those in progress at the given clock. """
+        for step in self.at(clock, who):
+            yield step
+        spans = self.spans.get(who, [])
+        i = bisect_right(self.starts.get(who, []), clock)
+        while i < len(spans):
+            yield spans[i].step
+            i += 1